@@ -1,11 +1,38 @@
 #!/usr/bin/env python3
+import atexit
+import concurrent.futures
+import csv
+import json
 import os
 import subprocess
 import hashlib
 import psutil
 import shutil
+import stat
+import threading
+import time
 from datetime import datetime
 
+try:
+    import blake3  # Optional: only needed when EXPECTED_HASH_ALGO = "blake3"
+except ImportError:
+    blake3 = None
+
+try:
+    import pynvml  # Optional: queries NVML directly instead of spawning nvidia-smi
+except ImportError:
+    pynvml = None
+
+# Initialise NVML once per process; nvmlInit() is the expensive part of a query.
+NVML_READY = False
+if pynvml is not None:
+    try:
+        pynvml.nvmlInit()
+        atexit.register(pynvml.nvmlShutdown)
+        NVML_READY = True
+    except pynvml.NVMLError:
+        pass
+
 # --- Configuration ---------------------------------------------------
 # TODO: You MUST change these two values for the file check to work.
 
@@ -13,9 +40,45 @@ from datetime import datetime
 #    Example: "/etc/hosts" or "C:\\Windows\\System32\\drivers\\etc\\hosts"
 FILE_TO_CHECK = "/etc/" 
 
-# 2. The known-good SHA256 hash of that file. 
+# 2. The known-good hash of that file, made with EXPECTED_HASH_ALGO below.
 #    See "Part 3: How to Use" for instructions on how to generate this.
-EXPECTED_SHA256_HASH = "SHA256"
+EXPECTED_HASH = "SHA256"
+
+# 3. The algorithm that produced the hash above: "sha256" (default),
+#    "blake2b" (faster, built into Python), or "blake3" (fastest on large
+#    files; requires `pip install blake3`).
+EXPECTED_HASH_ALGO = "sha256"
+
+# Read size used when hashing a file without hashlib.file_digest (8 MiB).
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Digests are cached by (mtime, ctime, size, inode, device) so an unchanged
+# file is not rehashed; ctime can't be set from userspace, so `cp -p`,
+# `touch -d` and the like still force a rehash. Entries older than
+# INTEGRITY_CACHE_MAX_AGE seconds are always rehashed.
+# Set GIAL_NO_INTEGRITY_CACHE=1 in the environment to always rehash.
+INTEGRITY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "gial", "integrity.json")
+INTEGRITY_CACHE_MAX_AGE = 24 * 60 * 60
+INTEGRITY_CACHE_DISABLED = os.environ.get("GIAL_NO_INTEGRITY_CACHE", "") not in ("", "0")
+
+# Fields requested from `nvidia-smi --query-gpu` when NVML is unavailable
+GPU_QUERY_FIELDS = "index,utilization.gpu,memory.used,memory.total,temperature.gpu,power.draw"
+GPU_FIELD_COUNT = len(GPU_QUERY_FIELDS.split(","))
+
+# Sampling period of the long-running `nvidia-smi -lms` poller (milliseconds),
+# how long a query waits for nvidia-smi to answer (seconds), and after how many
+# missed intervals the latest sample counts as stale.
+GPU_POLL_INTERVAL_MS = 500
+GPU_POLL_TIMEOUT = 5.0
+GPU_POLL_STALE_INTERVALS = 4
+
+# How long closing the poller waits for nvidia-smi after SIGTERM, and again
+# after SIGKILL, before giving up on it (seconds).
+GPU_POLL_CLOSE_TIMEOUT = 1.0
+
+# CPU usage is averaged from the start of the report until the other checks
+# finish, but over no less than this many seconds.
+CPU_SAMPLE_MIN_SECONDS = 0.5
 
 # --- Health Thresholds (percentage) ---
 CPU_WARN_THRESHOLD = 85.0
@@ -34,38 +97,102 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
+# Per-thread output buffer, set while a check runs in the thread pool
+_output = threading.local()
+
+def emit(text):
+    """Prints a line, or buffers it when called from a parallel check."""
+    lines = getattr(_output, "lines", None)
+    if lines is None:
+        print(text)
+    else:
+        lines.append(text)
+
+def run_buffered(check, *args):
+    """Runs a check and returns its output lines instead of printing them.
+
+    An exception from the check is reported as a failure line in its own
+    section, so one broken check can't take the rest of the report with it.
+    """
+    _output.lines = []
+    try:
+        check(*args)
+    except Exception as e:
+        print_fail(f"{check.__name__} failed", str(e))
+    finally:
+        lines, _output.lines = _output.lines, None
+    return lines
+
+# Line templates with the color codes baked in once at import time
+_HEADER_FMT = f"\n{bcolors.HEADER}{bcolors.BOLD}--- %s ---{bcolors.ENDC}"
+_OK_FMT = f"✅ {bcolors.OKGREEN}%-25s{bcolors.ENDC}%s"
+_WARN_FMT = f"⚠️ {bcolors.WARNING}%-25s{bcolors.ENDC}%s"
+_FAIL_FMT = f"❌ {bcolors.FAIL}%-25s{bcolors.ENDC}%s"
+_INFO_FMT = f"ℹ️ {bcolors.OKCYAN}%-25s{bcolors.ENDC}%s"
+
 def print_header(title):
     """Prints a bold, formatted header."""
-    print(f"\n{bcolors.HEADER}{bcolors.BOLD}--- {title} ---{bcolors.ENDC}")
+    emit(_HEADER_FMT % title)
 
 def print_ok(key, value=""):
     """Prints a success message."""
-    print(f"✅ {bcolors.OKGREEN}{key:<25}{bcolors.ENDC}{value}")
+    emit(_OK_FMT % (key, value))
 
 def print_warn(key, value=""):
     """Prints a warning message."""
-    print(f"⚠️ {bcolors.WARNING}{key:<25}{bcolors.ENDC}{value}")
+    emit(_WARN_FMT % (key, value))
 
 def print_fail(key, value=""):
     """Prints a failure message."""
-    print(f"❌ {bcolors.FAIL}{key:<25}{bcolors.ENDC}{value}")
+    emit(_FAIL_FMT % (key, value))
     
 def print_info(key, value=""):
     """Prints an informational message."""
-    print(f"ℹ️ {bcolors.OKCYAN}{key:<25}{bcolors.ENDC}{value}")
+    emit(_INFO_FMT % (key, value))
 
 def check_command_exists(command):
     """Checks if a command-line tool is available in the system's PATH."""
     return shutil.which(command) is not None
 
+# This process, used to leave the report's own CPU load out of the reading
+_proc = psutil.Process()
+
+# time.monotonic() and this process's CPU seconds at the last prime_cpu_usage()
+_cpu_primed_at = None
+_cpu_primed_own_time = None
+
+def own_cpu_seconds():
+    """Returns CPU time used by this process and its reaped children."""
+    times = _proc.cpu_times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def prime_cpu_usage():
+    """Starts the CPU usage sampling window read by check_cpu_health()."""
+    global _cpu_primed_at, _cpu_primed_own_time
+    psutil.cpu_percent(interval=None)
+    _cpu_primed_own_time = own_cpu_seconds()
+    _cpu_primed_at = time.monotonic()
+
 def check_cpu_health():
-    """Checks CPU usage, load, and core count."""
+    """Checks core count and CPU usage since prime_cpu_usage() was called.
+
+    The usage excludes this script's own load (hashing, finished nvidia-smi
+    runs), so a report doesn't warn about the work it is doing itself.
+    """
     print_header("CPU Health")
     print_info("Physical Cores", psutil.cpu_count(logical=False))
     print_info("Logical Cores", psutil.cpu_count(logical=True))
     
-    # Get CPU usage over a 1-second interval for a more accurate reading
-    cpu_usage = psutil.cpu_percent(interval=1)
+    if _cpu_primed_at is None:
+        prime_cpu_usage()
+    # Top the window up to the minimum so a fast report still gets a usable reading
+    remaining = CPU_SAMPLE_MIN_SECONDS - (time.monotonic() - _cpu_primed_at)
+    if remaining > 0:
+        time.sleep(remaining)
+    system_usage = psutil.cpu_percent(interval=None)
+    elapsed = time.monotonic() - _cpu_primed_at
+    own_usage = 100.0 * (own_cpu_seconds() - _cpu_primed_own_time) / (elapsed * (psutil.cpu_count() or 1))
+    cpu_usage = round(max(0.0, system_usage - own_usage), 1)
     if cpu_usage > CPU_WARN_THRESHOLD:
         print_warn("Current Usage", f"{cpu_usage}%")
     else:
@@ -95,25 +222,102 @@ def check_disk_health():
     else:
         print_ok("Root ('/') Usage", f"{disk.percent}% ({disk_used_gb:.2f}/{disk_total_gb:.2f} GB)")
 
-def check_file_integrity(filepath, expected_hash):
-    """Calculates the SHA256 hash of a file and compares it to a trusted value."""
+def hash_file(filepath, algo="sha256"):
+    """Returns the hex digest of a file using the given hash algorithm.
+
+    Files are read rather than memory-mapped: a mapped file that is truncated
+    mid-hash kills the process with SIGBUS, and this check exists precisely
+    for files that may be changing or damaged.
+    """
+    if algo == "blake3":
+        if blake3 is None:
+            raise RuntimeError("blake3 module not installed (pip install blake3).")
+        # Multithreaded, SIMD hashing. update_mmap() is avoided for the SIGBUS
+        # reason above; 8 MiB updates still give it enough to spread across cores.
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+    else:
+        # The digest only detects accidental corruption; it is not used for security
+        hasher = hashlib.new(algo, usedforsecurity=False)
+
+    # Unbuffered, so file_digest() can readinto its own reusable buffer
+    with open(filepath, 'rb', buffering=0) as f:
+        if algo != "blake3" and hasattr(hashlib, 'file_digest'):
+            # Python 3.11+: the read loop runs in C
+            hasher = hashlib.file_digest(f, hasher.copy)
+        else:
+            # Read file in large chunks to keep per-read overhead low
+            buf = f.read(HASH_CHUNK_SIZE)
+            while len(buf) > 0:
+                hasher.update(buf)
+                buf = f.read(HASH_CHUNK_SIZE)
+
+    return hasher.hexdigest()
+
+def load_integrity_cache():
+    """Returns the cached digests, or an empty dict if there are none."""
+    try:
+        with open(INTEGRITY_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def save_integrity_cache(cache):
+    """Writes the digest cache, replacing the old file atomically."""
+    try:
+        os.makedirs(os.path.dirname(INTEGRITY_CACHE_FILE), exist_ok=True)
+        tmp_path = f"{INTEGRITY_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, INTEGRITY_CACHE_FILE)
+    except OSError:
+        pass  # The cache is only an optimisation
+
+def check_file_integrity(filepath, expected_hash, algo="sha256"):
+    """Calculates the hash of a file and compares it to a trusted value."""
     print_header("File Integrity Check")
     print_info("File Path", filepath)
+    print_info("Hash Algorithm", algo)
     
-    if not os.path.exists(filepath):
+    # One stat() both checks existence and feeds the digest cache below
+    try:
+        st = os.stat(filepath)
+    except OSError:
         print_fail("Status", "File does not exist.")
         return
+    if not stat.S_ISREG(st.st_mode):
+        print_fail("Status", "Not a regular file.")
+        return
 
     try:
-        hasher = hashlib.sha256()
-        with open(filepath, 'rb') as f:
-            # Read file in chunks to handle large files efficiently
-            buf = f.read(65536)
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(65536)
-        
-        calculated_hash = hasher.hexdigest()
+        cache_key = os.path.realpath(filepath)
+        fingerprint = {
+            "mtime_ns": st.st_mtime_ns,
+            "ctime_ns": st.st_ctime_ns,
+            "size": st.st_size,
+            "ino": st.st_ino,
+            "dev": st.st_dev,
+            "algo": algo,
+        }
+        cache = {} if INTEGRITY_CACHE_DISABLED else load_integrity_cache()
+        entry = cache.get(cache_key)
+        now = time.time()
+
+        if (isinstance(entry, dict)
+                and all(entry.get(k) == v for k, v in fingerprint.items())
+                and isinstance(entry.get("hashed_at"), (int, float))
+                and 0 <= now - entry["hashed_at"] < INTEGRITY_CACHE_MAX_AGE
+                and str(entry.get("digest", "")).lower() == expected_hash.lower()):
+            # Unchanged since it was last verified, so skip the rehash
+            print_info("Expected Hash", expected_hash)
+            print_info("Cached Hash", entry["digest"])
+            print_ok("Status", "File integrity verified (unchanged since last check).")
+            return
+
+        calculated_hash = hash_file(filepath, algo)
+        if not INTEGRITY_CACHE_DISABLED:
+            cache[cache_key] = dict(fingerprint, digest=calculated_hash, hashed_at=now)
+            save_integrity_cache(cache)
         
         print_info("Expected Hash", expected_hash)
         print_info("Calculated Hash", calculated_hash)
@@ -126,40 +330,248 @@ def check_file_integrity(filepath, expected_hash):
     except Exception as e:
         print_fail("Error checking file", str(e))
 
+def print_gpu(index, util, mem_used_mib, mem_total_mib, temp, power=None):
+    """Prints a one-line summary for a single GPU."""
+    summary = f"{util}% util, {mem_used_mib}/{mem_total_mib} MiB, {temp}°C"
+    try:
+        # nvidia-smi reports "[N/A]" or "[Not Supported]" on boards without a sensor
+        summary += f", {float(power):g} W"
+    except (TypeError, ValueError):
+        pass
+    print_info(f"GPU {index}", summary)
+
+def check_gpu_health_nvml():
+    """Queries each GPU through the NVML bindings."""
+    try:
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+            util = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+            try:
+                power = pynvml.nvmlDeviceGetPowerUsage(handle) / 1000  # milliwatts
+            except pynvml.NVMLError:
+                power = None  # Not supported on this board
+            print_gpu(i, util.gpu, mem.used // (1024**2), mem.total // (1024**2), temp, power)
+        print_ok("GPU Status", "Successfully queried.")
+
+    except pynvml.NVMLError as e:
+        print_fail("NVML query failed", str(e))
+    except Exception as e:
+        print_fail("An unknown error occurred", str(e))
+
+def parse_gpu_row(line):
+    """Parses one `nvidia-smi --query-gpu` CSV line into a row of fields."""
+    row = next(csv.reader([line], skipinitialspace=True))
+    if len(row) != GPU_FIELD_COUNT or not row[0].isdigit():
+        # Anything but a GPU row is nvidia-smi reporting an error
+        raise RuntimeError(line)
+    return row
+
+def parse_gpu_rows(text):
+    """Parses `nvidia-smi --query-gpu` CSV output into a list of rows."""
+    return [parse_gpu_row(line.strip()) for line in text.splitlines() if line.strip()]
+
+def query_gpus_once():
+    """Runs nvidia-smi once and returns one CSV row per GPU."""
+    # CSV query output is far cheaper for nvidia-smi to produce than its full table
+    result = subprocess.run(
+        ['nvidia-smi', f'--query-gpu={GPU_QUERY_FIELDS}', '--format=csv,noheader,nounits'],
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=GPU_POLL_TIMEOUT
+    )
+    return parse_gpu_rows(result.stdout)
+
+class GPUPoller:
+    """Keeps one `nvidia-smi -lms` process alive and serves its latest sample.
+
+    Repeated queries then cost a lookup instead of a fork+exec and a full
+    NVML initialisation each. The process is started on the first read(),
+    which is answered from a one-shot query_gpus_once() in the meantime.
+    A reader thread drains its output as it arrives, so the pipe never fills
+    and each sample is timestamped when nvidia-smi wrote it. Each sample is
+    a complete burst of one row per GPU; a burst is known to be complete
+    once it has as many rows as the previous one, or once the next starts.
+    """
+
+    def __init__(self, interval_ms=GPU_POLL_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self._proc = None
+        self._lock = threading.Lock()  # Serialises read() and close()
+        self._cond = threading.Condition()  # Guards state shared with the reader thread
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._partial = b""
+        self._burst = {}
+        self._gpu_count = None
+        self._sample = None
+        self._sample_time = None
+        self._error = None
+
+    def _start(self):
+        # Seed the first sample and the GPU count with a one-shot query, so the
+        # first read() needn't wait for nvidia-smi's loop to emit a full burst
+        rows = query_gpus_once()
+        with self._cond:
+            self._sample = rows
+            self._sample_time = time.monotonic()
+            self._gpu_count = len(rows)
+
+        proc = subprocess.Popen(
+            ['nvidia-smi', f'--query-gpu={GPU_QUERY_FIELDS}', '--format=csv,noheader,nounits',
+             '-lms', str(self.interval_ms)],
+            stdout=subprocess.PIPE,
+            # Driver diagnostics end up in the same stream as the rows
+            stderr=subprocess.STDOUT
+        )
+        with self._cond:
+            self._proc = proc
+        threading.Thread(target=self._pump, args=(proc,), name="nvidia-smi-reader", daemon=True).start()
+
+    def _pump(self, proc):
+        """Reader thread: feeds nvidia-smi's output to _consume() until EOF."""
+        with proc.stdout:
+            fd = proc.stdout.fileno()
+            for chunk in iter(lambda: os.read(fd, 65536), b""):
+                with self._cond:
+                    if self._proc is not proc:
+                        return  # Closed or replaced; the output is no longer wanted
+                    try:
+                        self._consume(chunk)
+                    except RuntimeError as e:
+                        self._error = str(e)
+                        return
+                    finally:
+                        self._cond.notify_all()
+
+        try:
+            returncode = proc.wait(timeout=GPU_POLL_CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            returncode = None
+        with self._cond:
+            if self._proc is proc and self._error is None:
+                self._error = f"nvidia-smi exited with status {returncode}."
+                self._cond.notify_all()
+
+    def _finish_burst(self):
+        self._sample = [self._burst[index] for index in sorted(self._burst, key=int)]
+        self._sample_time = time.monotonic()
+        self._gpu_count = len(self._burst)
+        self._burst = {}
+
+    def _consume(self, chunk):
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            text = line.decode(errors="replace").strip()
+            if not text:
+                continue
+            row = parse_gpu_row(text)
+            if row[0] in self._burst:
+                self._finish_burst()  # A new sample started before the last filled up
+            self._burst[row[0]] = row
+            if len(self._burst) == self._gpu_count:
+                self._finish_burst()
+
+    def read(self, timeout=GPU_POLL_TIMEOUT):
+        """Returns the latest complete sample: one CSV row per GPU, by index."""
+        with self._lock:
+            if self._proc is None:
+                self._start()
+
+            with self._cond:
+                # Block only until the first full sample (or an error) arrives
+                self._cond.wait_for(lambda: self._sample is not None or self._error is not None, timeout)
+                error, sample, sample_time = self._error, self._sample, self._sample_time
+
+            if error is not None:
+                self.close()
+                raise RuntimeError(error)
+            if sample is None:
+                raise RuntimeError(f"No complete sample from nvidia-smi within {timeout} seconds.")
+            age = time.monotonic() - sample_time
+            if age > GPU_POLL_STALE_INTERVALS * self.interval_ms / 1000:
+                # nvidia-smi has hung or stopped reporting; restart it next time
+                self.close()
+                raise RuntimeError(f"Latest nvidia-smi sample is {age:.1f} seconds old.")
+            return list(sample)
+
+    def close(self):
+        """Stops the nvidia-smi process and returns its exit status.
+
+        Never blocks for more than twice GPU_POLL_CLOSE_TIMEOUT: a process
+        stuck in the driver that survives SIGKILL is abandoned (None).
+        """
+        with self._cond:
+            proc, self._proc = self._proc, None
+            self._reset()
+        if proc is None:
+            return None
+        # The reader thread owns proc.stdout and closes it once the pipe hits EOF
+        if proc.poll() is None:
+            proc.terminate()
+        try:
+            return proc.wait(timeout=GPU_POLL_CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        try:
+            return proc.wait(timeout=GPU_POLL_CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return None
+
+gpu_poller = GPUPoller()
+
 def check_gpu_health():
-    """Runs nvidia-smi to check GPU status."""
+    """Checks GPU status via NVML, falling back to querying nvidia-smi."""
     print_header("NVIDIA GPU Health")
+    if NVML_READY:
+        check_gpu_health_nvml()
+        return
+
     if not check_command_exists("nvidia-smi"):
         print_fail("nvidia-smi", "Command not found. Please ensure NVIDIA drivers are installed.")
         return
         
     try:
-        result = subprocess.run(
-            ['nvidia-smi'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        # Print the detailed output from the command
-        print(f"{bcolors.OKBLUE}{result.stdout}{bcolors.ENDC}")
+        rows = gpu_poller.read()
+        for row in rows:
+            print_gpu(*row)
         print_ok("GPU Status", "Successfully queried.")
             
     except subprocess.CalledProcessError as e:
         print_fail("nvidia-smi failed", e.stderr)
+    except subprocess.TimeoutExpired:
+        print_fail("nvidia-smi failed", f"No response within {GPU_POLL_TIMEOUT} seconds.")
     except FileNotFoundError:
         print_fail("nvidia-smi", "Command not found. Is it in your system's PATH?")
+    except RuntimeError as e:
+        print_fail("nvidia-smi failed", str(e))
     except Exception as e:
         print_fail("An unknown error occurred", str(e))
 
 def main():
     """Main function to run all health checks."""
+    # CPU usage is measured over the time the other checks take to run
+    prime_cpu_usage()
     print(f"{bcolors.BOLD}System Health Report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{bcolors.ENDC}")
     
-    check_cpu_health()
-    check_memory_health()
-    check_disk_health()
-    check_file_integrity(FILE_TO_CHECK, EXPECTED_SHA256_HASH)
-    check_gpu_health()
+    checks = [
+        (check_memory_health,),
+        (check_disk_health,),
+        (check_file_integrity, FILE_TO_CHECK, EXPECTED_HASH, EXPECTED_HASH_ALGO),
+        (check_gpu_health,),
+    ]
+    # The checks are independent, so run them side by side. The CPU reading
+    # is taken once the pool has finished them, so its window covers that work.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = [executor.submit(run_buffered, *check) for check in checks]
+    sections = [run_buffered(check_cpu_health)] + [future.result() for future in futures]
+    for lines in sections:
+        print("\n".join(lines))
     
     print("\n--- Report Complete ---\n")
 
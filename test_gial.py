@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for gial.GPUPoller, run against a fake nvidia-smi on PATH."""
+import os
+import signal
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from unittest import mock
+
+try:
+    import gial
+except ImportError as e:  # gial needs psutil
+    raise unittest.SkipTest(f"gial is not importable: {e}")
+
+GPU0 = "0, 10, 100, 81559, 40, 300.5"
+GPU1 = "1, 20, 200, 81559, 50, [N/A]"
+
+def rows(*lines):
+    return [gial.parse_gpu_row(line) for line in lines]
+
+class ConsumeTests(unittest.TestCase):
+    """_consume() turns raw nvidia-smi output into complete samples."""
+
+    def test_groups_rows_into_bursts_across_chunks(self):
+        poller = gial.GPUPoller()
+        poller._consume(f"{GPU0}\n{GPU1[:5]}".encode())
+        self.assertIsNone(poller._sample)
+
+        # The second burst starting is what marks the first one complete
+        poller._consume(f"{GPU1[5:]}\n{GPU0}\n".encode())
+        self.assertEqual(poller._sample, rows(GPU0, GPU1))
+        self.assertEqual(poller._gpu_count, 2)
+
+        # Once the GPU count is known, a burst completes on its last row
+        poller._consume(f"{GPU1}\n".encode())
+        self.assertEqual(poller._burst, {})
+
+    def test_rejects_lines_that_are_not_gpu_rows(self):
+        poller = gial.GPUPoller()
+        message = "NVIDIA-SMI has failed because it couldn't communicate with the NVIDIA driver."
+        with self.assertRaisesRegex(RuntimeError, "couldn't communicate"):
+            poller._consume(f"{message}\n".encode())
+        with self.assertRaises(RuntimeError):
+            poller._consume(b"0, 10, 100\n")
+
+@unittest.skipUnless(os.name == "posix", "fake nvidia-smi is a shebang script")
+class PollerProcessTests(unittest.TestCase):
+    """read() and close() against a real child process."""
+
+    def fake_nvidia_smi(self, loop_body):
+        """Puts a fake nvidia-smi on PATH; `-lms` runs execute loop_body."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        script = os.path.join(tmpdir.name, "nvidia-smi")
+        with open(script, "w") as f:
+            f.write(f"#!{sys.executable}\n")
+            f.write(textwrap.dedent(f"""\
+                import signal, sys, time
+                print({GPU0!r}); print({GPU1!r}); sys.stdout.flush()
+                if "-lms" not in sys.argv:
+                    sys.exit(0)
+                """))
+            f.write(textwrap.dedent(loop_body))
+        os.chmod(script, 0o755)
+        patcher = mock.patch.dict(os.environ, {"PATH": tmpdir.name + os.pathsep + os.environ["PATH"]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_poller(self, interval_ms):
+        poller = gial.GPUPoller(interval_ms=interval_ms)
+        self.addCleanup(poller.close)
+        return poller
+
+    def test_first_read_is_answered_by_the_seed_query(self):
+        self.fake_nvidia_smi("time.sleep(30)\n")
+        poller = self.make_poller(interval_ms=5000)
+        start = time.monotonic()
+        self.assertEqual(poller.read(), rows(GPU0, GPU1))
+        self.assertLess(time.monotonic() - start, 2.0)
+
+    def test_read_fails_once_the_latest_sample_is_stale(self):
+        self.fake_nvidia_smi("time.sleep(30)\n")
+        poller = self.make_poller(interval_ms=50)
+        poller.read()
+        time.sleep((gial.GPU_POLL_STALE_INTERVALS + 2) * 0.05)
+        with self.assertRaisesRegex(RuntimeError, "seconds old"):
+            poller.read()
+        self.assertIsNone(poller._proc)
+
+    def test_read_reports_nvidia_smi_errors(self):
+        self.fake_nvidia_smi("""\
+            print("Unable to determine the device handle for GPU 1: Unknown Error", flush=True)
+            sys.exit(15)
+            """)
+        poller = self.make_poller(interval_ms=50)
+        poller.read()
+        time.sleep(0.5)
+        with self.assertRaisesRegex(RuntimeError, "Unknown Error"):
+            poller.read()
+
+    def test_close_kills_a_process_that_ignores_sigterm(self):
+        self.fake_nvidia_smi("""\
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            time.sleep(30)
+            """)
+        poller = self.make_poller(interval_ms=50)
+        poller.read()
+        time.sleep(0.5)  # Let the child install its SIGTERM handler
+        with mock.patch.object(gial, "GPU_POLL_CLOSE_TIMEOUT", 0.2):
+            proc = poller._proc
+            start = time.monotonic()
+            returncode = poller.close()
+        self.assertEqual(returncode, -signal.SIGKILL)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertIsNotNone(proc.poll())
+
+if __name__ == "__main__":
+    unittest.main()